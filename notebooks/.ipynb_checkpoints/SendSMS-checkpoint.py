@@ -5,10 +5,10 @@
 
 # Cell 2 — Imports
 import os
-import json
 from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from twilio.rest import Client
 
 try:
@@ -63,19 +63,22 @@ def send_sms_via_twilio(to: str, body: str) -> str:
     return msg.sid
 
 # Cell 6 — Send via HTTP API (FastAPI service)
+# Reuse one HTTP session so repeated sends ride a kept-alive connection
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+# Content-Type is set by requests when the body is passed as json=
+_HEADERS = {"Accept": "application/json"}
+
 def send_sms_via_api(to: str, body: str, base: Optional[str] = None, token: Optional[str] = None) -> dict:
     base = base or API_BASE
     token = token or API_TOKEN
     if not token:
         raise RuntimeError("API_TOKEN is not set. Provide a token for the Bearer Authorization header.")
     url = f"{base.rstrip('/')}/send"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
+    headers = {**_HEADERS, "Authorization": f"Bearer {token}"}
     payload = {"to": to, "message": body}
-    resp = requests.post(url, headers=headers, data=json.dumps(payload), timeout=30)
+    resp = _SESSION.post(url, headers=headers, json=payload, timeout=30)
     if resp.status_code != 200:
         raise RuntimeError(f"API Error {resp.status_code}: {resp.text}")
     return resp.json()
@@ -1,52 +1,116 @@
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
+import asyncio
+import hmac
+import logging
 import os
 from fastapi import FastAPI, Depends, HTTPException, status, Header, Security
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from twilio.rest import Client
 
-app = FastAPI(title="Twilio SMS API")
+app = FastAPI(title="Twilio SMS API", default_response_class=ORJSONResponse)
 
 security = HTTPBearer(auto_error=False)
 
+logger = logging.getLogger(__name__)
+
 
 class SendRequest(BaseModel):
     to: str = Field(..., description="Destination number in E.164 format, e.g. +15551234567")
     message: str = Field(..., min_length=1, max_length=1600)
 
 
-def get_auth_token(credentials: Optional[HTTPAuthorizationCredentials] = Security(security)) -> None:
-    expected = os.getenv("API_TOKEN")
+@dataclass(frozen=True)
+class Config:
+    api_token: bytes
+    account_sid: Optional[str]
+    api_key: Optional[str]
+    api_secret: Optional[str]
+    auth_token: Optional[str]
+    messaging_service_sid: Optional[str]
+    from_number: Optional[str]
+
+
+@lru_cache(maxsize=1)
+def _config() -> Config:
+    # Env vars don't change for the life of the process; read them once
+    return Config(
+        api_token=os.getenv("API_TOKEN", "").encode(),
+        account_sid=os.getenv("TWILIO_ACCOUNT_SID"),
+        api_key=os.getenv("TWILIO_API_KEY"),
+        api_secret=os.getenv("TWILIO_API_SECRET"),
+        auth_token=os.getenv("TWILIO_AUTH_TOKEN"),
+        messaging_service_sid=os.getenv("TWILIO_MESSAGING_SERVICE_SID"),
+        from_number=os.getenv("TWILIO_FROM_NUMBER"),
+    )
+
+
+async def get_auth_token(credentials: Optional[HTTPAuthorizationCredentials] = Security(security)) -> None:
+    expected = _config().api_token
     if not expected:
         # If API_TOKEN not set, lock down the API by default
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="API not configured")
     if not credentials or credentials.scheme != "Bearer":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
-    token = credentials.credentials
-    if token != expected:
+    # Constant-time compare; bytes also accept non-ASCII tokens without raising
+    token = credentials.credentials.encode()
+    if not hmac.compare_digest(token, expected):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid token")
 
 
+@lru_cache(maxsize=1)
+def _twilio_http_client() -> AsyncTwilioHttpClient:
+    # Pooled aiohttp session shared by every send to api.twilio.com. First built
+    # by the startup warm-up (or a request), so it binds to the running event loop.
+    return AsyncTwilioHttpClient(pool_connections=True)
+
+
+@app.on_event("shutdown")
+async def close_twilio_http_client() -> None:
+    if _twilio_http_client.cache_info().currsize:
+        await _twilio_http_client().close()
+
+
+@lru_cache(maxsize=1)
 def twilio_client() -> Client:
-    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    if not account_sid:
+    # One Client per process so its HTTP session is reused across requests.
+    # Failures raise and are therefore not cached.
+    cfg = _config()
+    if not cfg.account_sid:
         raise HTTPException(status_code=500, detail="Missing TWILIO_ACCOUNT_SID")
 
-    api_key = os.getenv("TWILIO_API_KEY")
-    api_secret = os.getenv("TWILIO_API_SECRET")
-    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-
-    if api_key and api_secret:
-        return Client(api_key, api_secret, account_sid)
-    if auth_token:
-        return Client(account_sid, auth_token)
+    if cfg.api_key and cfg.api_secret:
+        return Client(cfg.api_key, cfg.api_secret, cfg.account_sid, http_client=_twilio_http_client())
+    if cfg.auth_token:
+        return Client(cfg.account_sid, cfg.auth_token, http_client=_twilio_http_client())
     raise HTTPException(status_code=500, detail="Missing Twilio credentials")
 
 
+@app.on_event("startup")
+async def warm_twilio_client() -> None:
+    # Build the client and open a pooled connection to api.twilio.com up front
+    # with a cheap authenticated GET, so the first /send skips TLS setup.
+    # Bounded so a slow or unreachable api.twilio.com can't hold up startup.
+    try:
+        client = twilio_client()
+        await asyncio.wait_for(client.api.v2010.accounts(_config().account_sid).fetch_async(), timeout=5)
+    except HTTPException as e:
+        logger.warning("Twilio client not configured: %s", e.detail)
+    except asyncio.TimeoutError:
+        logger.warning("Twilio warm-up request timed out; continuing startup")
+    except Exception as e:
+        logger.warning("Twilio warm-up request failed: %s", e)
+
+
 @app.post("/send")
-def send_sms(payload: SendRequest, _: None = Depends(get_auth_token)):
-    messaging_service_sid = os.getenv("TWILIO_MESSAGING_SERVICE_SID")
-    from_number = os.getenv("TWILIO_FROM_NUMBER")
+async def send_sms(payload: SendRequest, _: None = Depends(get_auth_token)):
+    cfg = _config()
+    messaging_service_sid = cfg.messaging_service_sid
+    from_number = cfg.from_number
 
     if not messaging_service_sid and not from_number:
         raise HTTPException(status_code=500, detail="Configure TWILIO_MESSAGING_SERVICE_SID or TWILIO_FROM_NUMBER")
@@ -60,7 +124,10 @@ def send_sms(payload: SendRequest, _: None = Depends(get_auth_token)):
         kwargs["from_"] = from_number
 
     try:
-        message = client.messages.create(**kwargs)
+        # The SDK's async client sends no timeout to aiohttp, so bound the call here
+        message = await asyncio.wait_for(client.messages.create_async(**kwargs), timeout=30)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out waiting for Twilio")
     except Exception as e:
         # TwilioRestException or other client error
         raise HTTPException(status_code=502, detail=str(e))
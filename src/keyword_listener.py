@@ -1,18 +1,32 @@
 import os
 import time
 import io
-import json
+import logging
+import math
 import re
-import tempfile
-from typing import List
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
 import numpy as np
 import sounddevice as sd
-import soundfile as sf
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from openai import OpenAI
 
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # Load environment
 load_dotenv()
 
@@ -24,29 +38,195 @@ TO_NUMBER = os.getenv("TO_NUMBER")
 DEFAULT_MESSAGE = os.getenv("MESSAGE", "Keyword detected from microphone")
 KEYWORDS = [k.strip() for k in os.getenv("KEYWORDS", "chicken nugget,chicken nuggets").split(",") if k.strip()]
 STT_MODEL = os.getenv("STT_MODEL", "gpt-4o-mini-transcribe")  # fallback: whisper-1 if your project has access
-USE_LOCAL_STT = os.getenv("USE_LOCAL_STT", "0") in ("1", "true", "True")
+USE_LOCAL_STT = os.getenv("USE_LOCAL_STT", "1") in ("1", "true", "True")
 LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "base.en")  # faster-whisper model id
+LOCAL_STT_DEVICE = os.getenv("LOCAL_STT_DEVICE", "auto")  # auto, cpu or cuda
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")  # e.g. int8_float16 on GPU
 PRINT_TRANSCRIPTS = os.getenv("PRINT_TRANSCRIPTS", "1") in ("1", "true", "True")
+# Transcripts are logged at DEBUG; PRINT_TRANSCRIPTS only picks the default level
+LOG_LEVEL = (os.getenv("LOG_LEVEL") or ("DEBUG" if PRINT_TRANSCRIPTS else "INFO")).upper()
+# Resolve to a numeric level; unknown names fall back to INFO instead of failing at startup
+_LOG_LEVEL_NO = logging.getLevelName(LOG_LEVEL)
+if not isinstance(_LOG_LEVEL_NO, int):
+    _LOG_LEVEL_NO = logging.INFO
 
 # Listener params
 SAMPLE_RATE = int(os.getenv("MIC_SAMPLE_RATE", "16000"))  # Whisper-friendly rate
 CHANNELS = 1
 BUFFER_SECONDS = float(os.getenv("BUFFER_SECONDS", "4"))
+MAX_BATCH_SECONDS = float(os.getenv("MAX_BATCH_SECONDS", "20"))  # cap when merging backlogged buffers
 COOLDOWN_SECONDS = float(os.getenv("DETECTION_COOLDOWN_SECONDS", "15"))
 SILENCE_THRESHOLD = float(os.getenv("SILENCE_THRESHOLD", "0.001"))  # RMS threshold to skip near-silence
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", "2"))  # webrtcvad mode, 0 (lenient) to 3 (strict)
+VAD_MIN_VOICED_FRAMES = int(os.getenv("VAD_MIN_VOICED_FRAMES", "4"))  # 30 ms frames of speech required
+
+logger = logging.getLogger(__name__)
 
 client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
+# webrtcvad only accepts these rates; otherwise fall back to the RMS gate
+_VAD = webrtcvad.Vad(VAD_AGGRESSIVENESS) if webrtcvad and SAMPLE_RATE in (8000, 16000, 32000, 48000) else None
+_VAD_FRAME = int(SAMPLE_RATE * 0.03)
+
+# Reuse one HTTP session so SMS API calls ride a kept-alive connection
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+# Content-Type is set by requests when the body is passed as json=
+_HEADERS = {
+    "Authorization": f"Bearer {API_TOKEN}",
+    "Accept": "application/json",
+}
+
 
 def _rms(audio: np.ndarray) -> float:
-    return float(np.sqrt(np.mean(np.square(audio), dtype=np.float64)))
+    # Single dot-product pass; avoids materializing a squared copy of the buffer
+    if not audio.size:
+        return 0.0
+    return math.sqrt(float(audio @ audio) / audio.size)
+
+
+# Scratch space for float32 -> int16 conversion, grown on demand and reused
+_PCM_SCALED = np.empty(0, dtype=np.float32)
+_PCM16 = np.empty(0, dtype="<i2")
+
+
+def _to_pcm16(audio: np.ndarray) -> np.ndarray:
+    # Scale, clip and narrow with in-place NumPy ops; no per-call allocations.
+    # Returns a view into shared scratch, valid until the next call.
+    global _PCM_SCALED, _PCM16
+    n = audio.size
+    if _PCM_SCALED.size < n:
+        _PCM_SCALED = np.empty(n, dtype=np.float32)
+        _PCM16 = np.empty(n, dtype="<i2")
+    scaled = _PCM_SCALED[:n]
+    np.multiply(audio, 32767.0, out=scaled)
+    np.clip(scaled, -32767.0, 32767.0, out=scaled)
+    pcm = _PCM16[:n]
+    np.copyto(pcm, scaled, casting="unsafe")
+    return pcm
+
+
+def has_speech(audio: np.ndarray) -> bool:
+    # Gate STT on voiced frames rather than raw loudness when webrtcvad is available
+    if _VAD is None:
+        return _rms(audio) >= SILENCE_THRESHOLD
+    pcm = _to_pcm16(audio)
+    n = pcm.size // _VAD_FRAME
+    voiced = 0
+    for frame in pcm[: n * _VAD_FRAME].reshape(n, _VAD_FRAME):
+        if _VAD.is_speech(frame.tobytes(), SAMPLE_RATE):
+            voiced += 1
+            if voiced >= VAD_MIN_VOICED_FRAMES:
+                return True
+    return False
 
 
-def record_buffer(seconds: float = BUFFER_SECONDS) -> np.ndarray:
-    frames = int(seconds * SAMPLE_RATE)
-    audio = sd.rec(frames, samplerate=SAMPLE_RATE, channels=CHANNELS, dtype="float32")
-    sd.wait()
-    return audio.reshape(-1)
+# Capture ring: a long-lived InputStream writes into it from PortAudio's thread,
+# so recording keeps going while the main loop is busy transcribing. It holds
+# up to MAX_BATCH_SECONDS so a slow STT call can be caught up without loss.
+_RING = np.zeros(int(SAMPLE_RATE * max(BUFFER_SECONDS * 2, MAX_BATCH_SECONDS)), dtype=np.float32)
+_ring_cond = threading.Condition()
+# record_buffer copies out into these, alternating, instead of allocating per call
+_CAPTURE_BUFS = (np.empty(_RING.size, dtype=np.float32), np.empty(_RING.size, dtype=np.float32))
+_capture_idx = 0
+_ring_written = 0  # total samples written by the callback
+_ring_read = 0  # total samples consumed by record_buffer
+_stream = None
+
+
+def _capture_callback(indata, frames, time_info, status) -> None:
+    global _ring_written
+    samples = indata[:, 0]
+    with _ring_cond:
+        start = _ring_written % _RING.size
+        end = start + frames
+        if end <= _RING.size:
+            _RING[start:end] = samples
+        else:
+            split = _RING.size - start
+            _RING[start:] = samples[:split]
+            _RING[: end - _RING.size] = samples[split:]
+        _ring_written += frames
+        _ring_cond.notify()
+
+
+def start_capture() -> sd.InputStream:
+    global _stream
+    if _stream is None:
+        _stream = sd.InputStream(
+            samplerate=SAMPLE_RATE,
+            channels=CHANNELS,
+            dtype="float32",
+            blocksize=1024,
+            callback=_capture_callback,
+        )
+        _stream.start()
+    return _stream
+
+
+def stop_capture() -> None:
+    global _stream
+    if _stream is not None:
+        _stream.close()
+        _stream = None
+
+
+def record_buffer(seconds: float = BUFFER_SECONDS) -> Tuple[np.ndarray, int]:
+    # Block until `seconds` of new audio has arrived, then return everything
+    # captured since the last call so consecutive windows are contiguous. If STT
+    # fell behind, the whole backlog comes back in one array (up to
+    # MAX_BATCH_SECONDS; only audio beyond that cap is skipped) along with how
+    # many buffers' worth it holds, so one STT call covers it.
+    # The array is a view into a double buffer: valid until the call after next.
+    global _ring_read, _capture_idx
+    frames = min(int(seconds * SAMPLE_RATE), _RING.size)
+    max_size = max(frames, min(int(MAX_BATCH_SECONDS * SAMPLE_RATE), _RING.size))
+    start_capture()
+    with _ring_cond:
+        # Short timeout keeps Ctrl+C responsive on platforms where lock waits block signals
+        while _ring_written - _ring_read < frames:
+            _ring_cond.wait(timeout=0.5)
+        end = _ring_written
+        if end - _ring_read > max_size:
+            _ring_read = end - max_size
+        size = end - _ring_read
+        start = _ring_read % _RING.size
+        _ring_read = end
+        _capture_idx ^= 1
+        audio = _CAPTURE_BUFS[_capture_idx][:size]
+        split = min(size, _RING.size - start)
+        audio[:split] = _RING[start : start + split]
+        audio[split:] = _RING[: size - split]
+    n_chunks = size // frames
+    return audio, n_chunks
+
+
+# Reused across calls; the OpenAI client reads it fully before returning
+_WAV_BUF = io.BytesIO()
+
+
+def _wav_header(n_bytes: int, sample_rate: int, channels: int = 1, bits: int = 16) -> bytes:
+    # Canonical 44-byte RIFF/WAVE header for uncompressed PCM
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + n_bytes, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits,
+        b"data", n_bytes,
+    )
+
+
+def encode_wav(audio: np.ndarray) -> io.BytesIO:
+    # 16-bit PCM, same format soundfile wrote by default, without the libsndfile round-trip.
+    # Half the bytes of float32 on the upload to the STT API.
+    pcm = _to_pcm16(audio)
+    _WAV_BUF.seek(0)
+    _WAV_BUF.truncate(0)
+    _WAV_BUF.write(_wav_header(pcm.nbytes, SAMPLE_RATE, CHANNELS))
+    _WAV_BUF.write(memoryview(pcm))
+    _WAV_BUF.seek(0)
+    return _WAV_BUF
 
 
 def transcribe_with_whisper(audio: np.ndarray) -> str:
@@ -54,9 +234,7 @@ def transcribe_with_whisper(audio: np.ndarray) -> str:
         raise RuntimeError("OPENAI_API_KEY not set. Please set it in your .env.")
 
     # Write to an in-memory WAV
-    buf = io.BytesIO()
-    sf.write(buf, audio, SAMPLE_RATE, format="WAV")
-    buf.seek(0)
+    buf = encode_wav(audio)
 
     # Call OpenAI Speech-to-Text API
     resp = client.audio.transcriptions.create(
@@ -68,74 +246,193 @@ def transcribe_with_whisper(audio: np.ndarray) -> str:
     return resp.text.strip() if hasattr(resp, "text") else str(resp)
 
 
-def transcribe_with_faster_whisper(audio: np.ndarray) -> str:
+WHISPER_SAMPLE_RATE = 16000  # faster-whisper expects 16 kHz mono float32 arrays
+
+
+@lru_cache(maxsize=1)
+def _stt_model():
+    # Loading the model is expensive; do it once and reuse it for every buffer
     try:
         from faster_whisper import WhisperModel
     except Exception as e:
         raise RuntimeError(
-            "Local STT fallback requires 'faster-whisper'. Install it with: pip install faster-whisper\n"
-            "Also ensure FFmpeg is available on PATH (Windows: winget install Gyan.FFmpeg or choco install ffmpeg)."
+            "Local STT requires 'faster-whisper'. Install it with: pip install faster-whisper\n"
+            "Or set USE_LOCAL_STT=0 and OPENAI_API_KEY to use the OpenAI Speech-to-Text API."
         ) from e
+    return WhisperModel(LOCAL_STT_MODEL, device=LOCAL_STT_DEVICE, compute_type=LOCAL_STT_COMPUTE_TYPE)
+
+
+def _resample(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    # Filtered (anti-aliased) resampling via libswresample, the same resampler
+    # faster-whisper uses when decoding files; PyAV ships with faster-whisper.
+    import av
+
+    frame = av.AudioFrame.from_ndarray(
+        np.ascontiguousarray(audio, dtype=np.float32).reshape(1, -1), format="flt", layout="mono"
+    )
+    frame.sample_rate = src_rate
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=dst_rate)
+    # Passing None flushes the samples still buffered inside the filter
+    out = resampler.resample(frame) + resampler.resample(None)
+    return np.concatenate([f.to_ndarray().reshape(-1) for f in out]) if out else np.zeros(0, dtype=np.float32)
+
+
+def transcribe_with_faster_whisper(audio: np.ndarray) -> str:
+    if SAMPLE_RATE != WHISPER_SAMPLE_RATE:
+        audio = _resample(audio, SAMPLE_RATE, WHISPER_SAMPLE_RATE)
+    # Feed the in-memory buffer directly; greedy decoding without timestamps
+    # is all a keyword check needs.
+    segments, _ = _stt_model().transcribe(
+        audio,
+        language="en",
+        beam_size=1,
+        best_of=1,
+        temperature=0.0,
+        condition_on_previous_text=False,
+        without_timestamps=True,
+        vad_filter=True,
+    )
+    return " ".join(seg.text for seg in segments).strip()
+
+
+class _PunctToSpace(dict):
+    # str.translate table mapping non-word, non-space characters to a space.
+    # Filled lazily so non-ASCII punctuation is handled the same as ASCII.
+    def __missing__(self, cp: int):
+        c = chr(cp)
+        value = cp if c.isalnum() or c == "_" or c.isspace() else " "
+        self[cp] = value
+        return value
 
-    # Write temp WAV (deleted immediately after)
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=True) as tmp:
-        sf.write(tmp.name, audio, SAMPLE_RATE, format="WAV")
-        model = WhisperModel(LOCAL_STT_MODEL, compute_type="int8")
-        segments, _ = model.transcribe(tmp.name, language="en")
-        text = " ".join(seg.text for seg in segments).strip()
-        return text
+
+_PUNCT_TO_SPACE = _PunctToSpace()
 
 
 def normalize_text(s: str) -> str:
-    # Lowercase, collapse whitespace, strip punctuation
-    s = s.casefold()
-    # Python's re does not support \p{Punct}; remove non-word, non-space chars
-    s = re.sub(r"[^\w\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # Lowercase, strip punctuation, collapse whitespace (split() also trims)
+    return " ".join(s.casefold().translate(_PUNCT_TO_SPACE).split())
 
 
-def contains_keyword(text: str, keywords: List[str]) -> bool:
-    norm = normalize_text(text)
+@lru_cache(maxsize=8)
+def _keyword_pattern(keywords: Tuple[str, ...]) -> Optional[re.Pattern]:
+    # One alternation over all keywords, compiled once per keyword set. Words
+    # inside a keyword may be separated by any run of non-word characters, which
+    # matches what normalize_text() used to collapse before a substring check.
+    alternatives = []
     for kw in keywords:
-        if kw and kw.casefold() in norm:
-            return True
-    return False
+        words = re.findall(r"\w+", kw.casefold())
+        if words:
+            alternatives.append(r"\W+".join(re.escape(w) for w in words))
+    if not alternatives:
+        return None
+    return re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + r")(?!\w)")
+
+
+@lru_cache(maxsize=8)
+def _keyword_automaton(keywords: Tuple[str, ...]):
+    # Aho-Corasick automaton over normalized keywords: one linear pass per
+    # transcript regardless of how many keywords are configured.
+    automaton = ahocorasick.Automaton()
+    for kw in keywords:
+        norm = normalize_text(kw)
+        if norm:
+            automaton.add_word(norm, len(norm))
+    if not len(automaton):
+        return None
+    automaton.make_automaton()
+    return automaton
+
+
+def contains_keyword(text: str, keywords: List[str]) -> bool:
+    if ahocorasick is not None:
+        automaton = _keyword_automaton(tuple(keywords))
+        if automaton is None:
+            return False
+        norm = normalize_text(text)
+        for end, length in automaton.iter(norm):
+            start = end - length + 1
+            # Normalized text separates words with single spaces; require whole words
+            if (start == 0 or norm[start - 1] == " ") and (end + 1 == len(norm) or norm[end + 1] == " "):
+                return True
+        return False
+
+    pattern = _keyword_pattern(tuple(keywords))
+    return bool(pattern and pattern.search(text.casefold()))
 
 
 def send_via_api(to: str, message: str) -> dict:
     url = f"{API_BASE.rstrip('/')}/send"
-    headers = {
-        "Authorization": f"Bearer {API_TOKEN}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
     payload = {"to": to, "message": message}
-    r = requests.post(url, headers=headers, data=json.dumps(payload), timeout=30)
+    r = _SESSION.post(url, headers=_HEADERS, json=payload, timeout=30)
     r.raise_for_status()
     return r.json()
 
 
+def _report_sms(future: Future) -> None:
+    try:
+        logger.info("SMS sent: %s", future.result())
+    except Exception as e:
+        logger.error("Failed to send SMS: %s", e)
+
+
+def warm_up() -> None:
+    # Pay one-time costs (model kernels and buffers, TCP connect to the SMS API)
+    # at startup rather than on the first detection
+    if USE_LOCAL_STT:
+        try:
+            # vad_filter stays off so the decoder actually runs on the silent clip
+            segments, _ = _stt_model().transcribe(
+                np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32),
+                language="en",
+                beam_size=1,
+                without_timestamps=True,
+            )
+            for _ in segments:
+                pass
+        except Exception as e:
+            logger.warning("STT warm-up failed: %s", e)
+    try:
+        _SESSION.head(API_BASE, timeout=5)
+    except requests.RequestException as e:
+        logger.warning("SMS API not reachable yet: %s", e)
+
+
 def main():
     if not API_TOKEN:
         raise RuntimeError("API_TOKEN is required to call the SMS API. Set it in your .env.")
     if not TO_NUMBER:
         raise RuntimeError("TO_NUMBER is required. Set it in your .env.")
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY is required for Whisper API. Set it in your .env.")
-
-    print("Mic keyword listener started.")
-    print(f"Keywords: {KEYWORDS}")
-    print(f"Buffer: {BUFFER_SECONDS}s, Sample rate: {SAMPLE_RATE} Hz, Cooldown: {COOLDOWN_SECONDS}s")
-    print("Press Ctrl+C to stop.")
-
-    last_detect_ts = 0.0
+    if not USE_LOCAL_STT and not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY is required for Whisper API (or set USE_LOCAL_STT=1). Set it in your .env.")
+
+    # Level applies to this module only, so DEBUG doesn't surface HTTP client chatter
+    logging.basicConfig(format="%(message)s")
+    logger.setLevel(_LOG_LEVEL_NO)
+    if _LOG_LEVEL_NO == logging.INFO and LOG_LEVEL != "INFO":
+        logger.warning("Unknown LOG_LEVEL %r; using INFO", LOG_LEVEL)
+    logger.info("Mic keyword listener started.")
+    logger.info("Keywords: %s", KEYWORDS)
+    logger.info("Buffer: %ss, Sample rate: %s Hz, Cooldown: %ss", BUFFER_SECONDS, SAMPLE_RATE, COOLDOWN_SECONDS)
+    logger.info("Press Ctrl+C to stop.")
+
+    if USE_LOCAL_STT:
+        logger.info("Loading local STT model '%s' (%s)...", LOCAL_STT_MODEL, LOCAL_STT_COMPUTE_TYPE)
+        _stt_model()
+    warm_up()
+
+    # Pipeline: PortAudio's callback thread captures, this loop runs STT, and a
+    # single worker sends SMS so a slow API call never delays the next buffer
+    sms_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sms")
+    start_capture()
+    next_allowed_ts = 0.0  # monotonic deadline for the detection cooldown
 
     while True:
         try:
-            audio = record_buffer(BUFFER_SECONDS)
-            # Skip near-silence to save API calls
-            if _rms(audio) < SILENCE_THRESHOLD:
+            audio, n_chunks = record_buffer(BUFFER_SECONDS)
+            if n_chunks > 1:
+                logger.debug("Catching up: transcribing %d buffers in one pass", n_chunks)
+            # Skip buffers without speech to save STT calls
+            if not has_speech(audio):
                 continue
 
             text = ""
@@ -149,40 +446,38 @@ def main():
                     err_msg = str(e)
                     if any(code in err_msg for code in ("model_not_found", "insufficient_quota", "401", "403")):
                         try:
-                            print("OpenAI STT unavailable; falling back to local faster-whisper...")
+                            logger.warning("OpenAI STT unavailable; falling back to local faster-whisper...")
                             text = transcribe_with_faster_whisper(audio)
                         except Exception as e2:
-                            print("Local STT fallback failed:", e2)
+                            logger.error("Local STT fallback failed: %s", e2)
                             continue
                     else:
-                        print("OpenAI STT error:", e)
+                        logger.error("OpenAI STT error: %s", e)
                         continue
             if not text:
                 continue
-            
-            # Print the raw transcription to stdout (toggle via PRINT_TRANSCRIPTS)
-            if PRINT_TRANSCRIPTS:
-                print(f"Transcription: {text}")
+
+            # Raw transcription at DEBUG (see LOG_LEVEL / PRINT_TRANSCRIPTS)
+            logger.debug("Transcription: %s", text)
 
             if contains_keyword(text, KEYWORDS):
-                now = time.time()
-                if now - last_detect_ts < COOLDOWN_SECONDS:
+                now = time.monotonic()
+                if now < next_allowed_ts:
                     # Debounce repeated detections
                     continue
-                last_detect_ts = now
+                next_allowed_ts = now + COOLDOWN_SECONDS
 
                 msg = f"Keyword detected: '{text}'" if DEFAULT_MESSAGE == "Keyword detected from microphone" else DEFAULT_MESSAGE
-                try:
-                    resp = send_via_api(TO_NUMBER, msg)
-                    print("SMS sent:", resp)
-                except Exception as e:
-                    print("Failed to send SMS:", e)
+                sms_pool.submit(send_via_api, TO_NUMBER, msg).add_done_callback(_report_sms)
             # else: drop the buffer; do nothing
         except KeyboardInterrupt:
-            print("\nStopping listener.")
+            logger.info("Stopping listener.")
+            stop_capture()
+            # Let an in-flight SMS finish before exiting
+            sms_pool.shutdown(wait=True)
             break
-        except Exception as e:
-            print("Error:", e)
+        except Exception:
+            logger.exception("Listener error")
             time.sleep(1)
 
 